@@ -1,3 +1,4 @@
+import argparse
 import struct
 import time
 import os
@@ -13,6 +14,16 @@ INODES_PER_GROUP = 2048
 BLOCK_COUNT = DISK_SIZE // BLOCK_SIZE
 GROUP_COUNT = (BLOCK_COUNT + BLOCKS_PER_GROUP - 1) // BLOCKS_PER_GROUP
 INODE_COUNT = INODES_PER_GROUP * GROUP_COUNT
+INODE_TABLE_BLOCKS = (INODES_PER_GROUP * INODE_SIZE) // BLOCK_SIZE
+
+# Format timestamp, read once; SOURCE_DATE_EPOCH makes images reproducible
+_NOW = int(os.environ.get("SOURCE_DATE_EPOCH") or time.time())
+
+# Precompiled struct formats
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+# Whole descriptor table: one 32-byte entry (20 used + 12 reserved) per group
+_GDT = struct.Struct("<" + "IIIHHHH12x" * GROUP_COUNT)
 
 # Superblock (1024 bytes, but only first ~100 used usually)
 # struct ext2_superblock {
@@ -58,17 +69,17 @@ def create_superblock():
         BLOCKS_PER_GROUP,   # s_blocks_per_group
         BLOCKS_PER_GROUP,   # s_frags_per_group
         INODES_PER_GROUP,   # s_inodes_per_group
-        int(time.time()),   # s_mtime
-        int(time.time()),   # s_wtime
+        _NOW,               # s_mtime
+        _NOW,               # s_wtime
         0,                  # s_mnt_count
         20,                 # s_max_mnt_count
     )
-    struct.pack_into("<H", sb, 56, 0xEF53) # s_magic
-    struct.pack_into("<H", sb, 58, 1)      # s_state (clean)
-    struct.pack_into("<H", sb, 60, 1)      # s_errors (continue)
+    _U16.pack_into(sb, 56, 0xEF53) # s_magic
+    _U16.pack_into(sb, 58, 1)      # s_state (clean)
+    _U16.pack_into(sb, 60, 1)      # s_errors (continue)
     
     # Revision 0 (simplest)
-    struct.pack_into("<I", sb, 76, 0)      # s_rev_level (0)
+    _U32.pack_into(sb, 76, 0)      # s_rev_level (0)
     
     return sb
 
@@ -84,253 +95,291 @@ def create_superblock():
 #   uint32_t bg_reserved[3];
 # }
 
-class BlockGroup:
-    def __init__(self, id):
-        self.id = id
-        # Layout:
-        # Block 0: Boot (if group 0) / Superblock (if backup) / Data
-        # But for 1KB blocks:
-        # Group 0:
-        #   Block 1: Superblock
-        #   Block 2 to 2+N: Group Descriptors
-        #   Block X: Block Bitmap
-        #   Block Y: Inode Bitmap
-        #   Block Z: Inode Table
-        
-        # Calculate offsets
-        # For simplicity, we put metadata at the start of every group?
-        # Standard Ext2 puts SB and GDT in specific groups (0, 1, 3, 5, 7...).
-        # But simpler to put copies in group 0 and that's it for now?
-        # Actually, let's follow standard layout.
-        
-        # We need to allocate blocks for metadata.
-        self.block_bitmap_blk = 0
-        self.inode_bitmap_blk = 0
-        self.inode_table_blk = 0
-        
-        self.free_blocks_count = BLOCKS_PER_GROUP
-        self.free_inodes_count = INODES_PER_GROUP
-        self.used_dirs_count = 0
-        
-        self.block_bitmap = bytearray(BLOCK_SIZE)
-        self.inode_bitmap = bytearray(BLOCK_SIZE)
-
-groups = []
-for i in range(GROUP_COUNT):
-    groups.append(BlockGroup(i))
-
-# Allocation logic
-current_block = 1 + 1 # Superblock (1) + GDT (assuming 1 block for 8 groups)
-# GDT size = 8 * 32 bytes = 256 bytes -> 1 block
-
-# Assign metadata blocks for each group
-for g in groups:
-    # Reserve Superblock and GDT space in Group 0
-    start_block = g.id * BLOCKS_PER_GROUP + 1 # +1 for first_data_block offset
-    if g.id == 0:
-        # Group 0 has SB (blk 1) and GDT (blk 2)
-        # So metadata starts at 3
-        # Mark SB and GDT as used in bitmap
-        g.block_bitmap[0] |= (1<<0) # Block 0 relative to group (Block 1 absolute)
-        g.block_bitmap[0] |= (1<<1) # Block 1 relative to group (Block 2 absolute)
-        
-        g.free_blocks_count -= 2
-        current_alloc = 3
-    else:
-        # Other groups don't strictly need SB copies for a minimal FS
-        # But we'll keep it simple. Standard mkfs puts backups.
-        # We won't put backups to keep it simple.
-        current_alloc = start_block
-
-    # Allocate Block Bitmap
-    g.block_bitmap_blk = current_alloc
-    # Mark in bitmap (relative to group start)
-    rel = current_alloc - (g.id * BLOCKS_PER_GROUP + 1)
-    g.block_bitmap[rel // 8] |= (1 << (rel % 8))
-    g.free_blocks_count -= 1
-    current_alloc += 1
-    
-    # Allocate Inode Bitmap
-    g.inode_bitmap_blk = current_alloc
-    rel = current_alloc - (g.id * BLOCKS_PER_GROUP + 1)
-    g.block_bitmap[rel // 8] |= (1 << (rel % 8))
-    g.free_blocks_count -= 1
-    current_alloc += 1
-    
-    # Allocate Inode Table
-    inode_table_blocks = (INODES_PER_GROUP * INODE_SIZE) // BLOCK_SIZE
-    g.inode_table_blk = current_alloc
-    
-    for k in range(inode_table_blocks):
-        rel = (current_alloc + k) - (g.id * BLOCKS_PER_GROUP + 1)
-        g.block_bitmap[rel // 8] |= (1 << (rel % 8))
-        g.free_blocks_count -= 1
-        
-    current_alloc += inode_table_blocks
-
-# Create Root Directory (Inode 2)
-root_inode_index = 2
-root_group_idx = (root_inode_index - 1) // INODES_PER_GROUP
-root_inode_offset = (root_inode_index - 1) % INODES_PER_GROUP
-groups[root_group_idx].inode_bitmap[root_inode_offset // 8] |= (1 << (root_inode_offset % 8))
-groups[root_group_idx].free_inodes_count -= 1
-groups[root_group_idx].used_dirs_count += 1
-
-# Reserve inodes 1-10
-for i in range(1, 11):
-    if i == 2: continue
-    grp = (i - 1) // INODES_PER_GROUP
-    off = (i - 1) % INODES_PER_GROUP
-    groups[grp].inode_bitmap[off // 8] |= (1 << (off % 8))
-    groups[grp].free_inodes_count -= 1
-
-# Allocate data block for Root Directory
-root_data_block = 0
-# Find free block in group 0
-g = groups[0]
-for i in range(BLOCKS_PER_GROUP):
-    if not (g.block_bitmap[i // 8] & (1 << (i % 8))):
-        g.block_bitmap[i // 8] |= (1 << (i % 8))
-        g.free_blocks_count -= 1
-        root_data_block = g.id * BLOCKS_PER_GROUP + 1 + i
-        break
-
-# Create lost+found (Inode 11)
-lf_inode_index = 11
-lf_group_idx = (lf_inode_index - 1) // INODES_PER_GROUP
-lf_inode_offset = (lf_inode_index - 1) % INODES_PER_GROUP
-groups[lf_group_idx].inode_bitmap[lf_inode_offset // 8] |= (1 << (lf_inode_offset % 8))
-groups[lf_group_idx].free_inodes_count -= 1
-groups[lf_group_idx].used_dirs_count += 1
-
-lf_data_block = 0
-g = groups[lf_group_idx]
-for i in range(BLOCKS_PER_GROUP):
-    if not (g.block_bitmap[i // 8] & (1 << (i % 8))):
-        g.block_bitmap[i // 8] |= (1 << (i % 8))
-        g.free_blocks_count -= 1
-        lf_data_block = g.id * BLOCKS_PER_GROUP + 1 + i
-        break
-
-# Update Superblock free counts
-total_free_blocks = sum(g.free_blocks_count for g in groups)
-total_free_inodes = sum(g.free_inodes_count for g in groups)
-
-sb_data = create_superblock()
-struct.pack_into("<I", sb_data, 12, total_free_blocks)
-struct.pack_into("<I", sb_data, 16, total_free_inodes)
-
-# Write to disk
-with open("disk.img", "wb") as f:
-    f.truncate(DISK_SIZE)
-    
+class GroupDesc:
+    # Mutable per-group descriptor state; fields() gives the on-disk order
+    __slots__ = ("block_bitmap", "inode_bitmap", "inode_table",
+                 "free_blocks", "free_inodes", "used_dirs")
+
+    def __init__(self, block_bitmap, inode_bitmap, inode_table, free_blocks):
+        self.block_bitmap = block_bitmap
+        self.inode_bitmap = inode_bitmap
+        self.inode_table = inode_table
+        self.free_blocks = free_blocks
+        self.free_inodes = INODES_PER_GROUP
+        self.used_dirs = 0
+
+    def fields(self):
+        return (self.block_bitmap, self.inode_bitmap, self.inode_table,
+                self.free_blocks, self.free_inodes, self.used_dirs,
+                0) # bg_pad
+
+# Absolute number of each group's first block (+1 for first_data_block offset)
+GROUP_BASE = tuple(i * BLOCKS_PER_GROUP + 1 for i in range(GROUP_COUNT))
+
+# Directory entry templates (inode numbers left 0, patched in at build time)
+# struct ext2_dir_entry {
+#   uint32_t inode;
+#   uint16_t rec_len;
+#   uint8_t  name_len;
+#   uint8_t  file_type;  // 2 = directory
+#   char     name[];     // padded to 4 bytes
+# }
+
+# Root: "." and ".." (12 bytes each), then "lost+found" spanning the rest
+ROOT_DIR_TEMPLATE = (
+    struct.pack("<IHBB4s", 0, 12, 1, 2, b'.') +
+    struct.pack("<IHBB4s", 0, 12, 2, 2, b'..') +
+    struct.pack("<IHBB10s", 0, BLOCK_SIZE - 24, 10, 2, b'lost+found')
+).ljust(BLOCK_SIZE, b'\x00')
+
+# lost+found: "." then ".." spanning the rest
+LF_DIR_TEMPLATE = (
+    struct.pack("<IHBB4s", 0, 12, 1, 2, b'.') +
+    struct.pack("<IHBB2s", 0, BLOCK_SIZE - 12, 2, 2, b'..')
+).ljust(BLOCK_SIZE, b'\x00')
+
+# Shared all-ones block, sliced (without copying) to fill bitmap ranges
+_ONES = memoryview(b'\xff' * BLOCK_SIZE)
+
+def set_bits_range(ba, start, count):
+    # Set bits [start, start + count) in bitmap ba: mask the head/tail bytes,
+    # fill the middle. The masks need no alignment special cases: an aligned
+    # start gives a full head mask and an aligned end an empty tail mask.
+    if count <= 0:
+        return
+    end = start + count
+    lo, hi = start >> 3, end >> 3
+    head = (0xFF << (start & 7)) & 0xFF
+    tail = (1 << (end & 7)) - 1
+    if lo == hi:
+        ba[lo] |= head & tail
+        return
+    ba[lo] |= head
+    ba[lo + 1:hi] = _ONES[:hi - lo - 1]
+    if tail: # an aligned end may sit one past the end of ba
+        ba[hi] |= tail
+
+def block_bitmap(bitmaps, group):
+    # View of group's block bitmap in the shared bitmap buffer
+    off = 2 * group * BLOCK_SIZE
+    return bitmaps[off:off + BLOCK_SIZE]
+
+def inode_bitmap(bitmaps, group):
+    # View of group's inode bitmap (stored right after its block bitmap)
+    off = (2 * group + 1) * BLOCK_SIZE
+    return bitmaps[off:off + BLOCK_SIZE]
+
+def alloc_block(descs, bitmaps, next_free, group):
+    # Claim the next free block of group and return its absolute number.
+    # Metadata is packed at the group start and data blocks are handed out in
+    # order, so the first free block is the group's next_free cursor; no scan.
+    rel = next_free[group]
+    if rel >= BLOCKS_PER_GROUP:
+        raise RuntimeError("block group %d has no free blocks" % group)
+    block_bitmap(bitmaps, group)[rel // 8] |= (1 << (rel % 8))
+    next_free[group] = rel + 1
+    descs[group].free_blocks -= 1
+    return GROUP_BASE[group] + rel
+
+def build_image():
+    # Lay out the whole filesystem and return the (offset, data) extents that
+    # hold non-zero data; everything else in the image is zero
+
+    # Per-group state: one GroupDesc per group, and the bitmaps in a single
+    # contiguous buffer, stored per group as [block bitmap, inode bitmap] in
+    # the same order they sit on disk.
+    descs = []
+    bitmaps = memoryview(bytearray(GROUP_COUNT * 2 * BLOCK_SIZE))
+    # Relative index of each group's first unallocated block
+    next_free = [0] * GROUP_COUNT
+
+    # Layout:
+    # Block 0: Boot (if group 0) / Superblock (if backup) / Data
+    # But for 1KB blocks:
+    # Group 0:
+    #   Block 1: Superblock
+    #   Block 2 to 2+N: Group Descriptors
+    #   Block X: Block Bitmap
+    #   Block Y: Inode Bitmap
+    #   Block Z: Inode Table
+
+    # Assign metadata blocks for each group
+    for i in range(GROUP_COUNT):
+        base = GROUP_BASE[i]
+        # Reserve Superblock and GDT space in Group 0
+        if i == 0:
+            # Group 0 has SB (blk 1) and GDT (blk 2)
+            # So metadata starts at 3
+            current_alloc = 3
+        else:
+            # Other groups don't strictly need SB copies for a minimal FS
+            # But we'll keep it simple. Standard mkfs puts backups.
+            # We won't put backups to keep it simple.
+            current_alloc = base
+
+        # Block Bitmap, Inode Bitmap, then Inode Table. SB/GDT (group 0 only)
+        # and these are contiguous from the group start, so mark them used in
+        # one range
+        used = current_alloc + 2 + INODE_TABLE_BLOCKS - base
+        set_bits_range(block_bitmap(bitmaps, i), 0, used)
+        next_free[i] = used
+        descs.append(GroupDesc(
+            block_bitmap=current_alloc,
+            inode_bitmap=current_alloc + 1,
+            inode_table=current_alloc + 2,
+            free_blocks=BLOCKS_PER_GROUP - used,
+        ))
+
+    # Create Root Directory (Inode 2)
+    root_inode_index = 2
+    root_group_idx = (root_inode_index - 1) // INODES_PER_GROUP
+    root_inode_offset = (root_inode_index - 1) % INODES_PER_GROUP
+    ib = inode_bitmap(bitmaps, root_group_idx)
+    ib[root_inode_offset // 8] |= (1 << (root_inode_offset % 8))
+    descs[root_group_idx].free_inodes -= 1
+    descs[root_group_idx].used_dirs += 1
+
+    # Reserve inodes 1-10 (bits 0-9 of group 0; root's bit is already set)
+    ib = inode_bitmap(bitmaps, 0)
+    ib[0] |= 0xFF
+    ib[1] |= 0x03
+    descs[0].free_inodes -= 9
+
+    # Allocate data block for Root Directory
+    root_data_block = alloc_block(descs, bitmaps, next_free, 0)
+
+    # Create lost+found (Inode 11)
+    lf_inode_index = 11
+    lf_group_idx = (lf_inode_index - 1) // INODES_PER_GROUP
+    lf_inode_offset = (lf_inode_index - 1) % INODES_PER_GROUP
+    ib = inode_bitmap(bitmaps, lf_group_idx)
+    ib[lf_inode_offset // 8] |= (1 << (lf_inode_offset % 8))
+    descs[lf_group_idx].free_inodes -= 1
+    descs[lf_group_idx].used_dirs += 1
+
+    lf_data_block = alloc_block(descs, bitmaps, next_free, lf_group_idx)
+
+    # Update Superblock free counts
+    total_free_blocks = sum(d.free_blocks for d in descs)
+    total_free_inodes = sum(d.free_inodes for d in descs)
+
+    sb_data = create_superblock()
+    _U32.pack_into(sb_data, 12, total_free_blocks)
+    _U32.pack_into(sb_data, 16, total_free_inodes)
+
+    # Unwritten regions (e.g. the inode tables) stay zero
+    extents = []
+
+    def put(off, data):
+        extents.append((off, data))
+
     # Write Superblock (Block 1)
-    f.seek(1024)
-    f.write(sb_data)
-    
+    put(1024, sb_data)
+
     # Write Group Descriptors (Block 2)
-    # 8 groups * 32 bytes = 256 bytes
+    # 8 groups * 32 bytes = 256 bytes -> 1 block
     gdt = bytearray(BLOCK_SIZE)
-    for i, g in enumerate(groups):
-        struct.pack_into("<IIIHHHH", gdt, i * 32,
-            g.block_bitmap_blk,
-            g.inode_bitmap_blk,
-            g.inode_table_blk,
-            g.free_blocks_count,
-            g.free_inodes_count,
-            g.used_dirs_count,
-            0 # pad
-        )
-    f.seek(2 * BLOCK_SIZE)
-    f.write(gdt)
-    
-    # Write Bitmaps and Inode Tables
-    for g in groups:
-        # Block Bitmap
-        f.seek(g.block_bitmap_blk * BLOCK_SIZE)
-        f.write(g.block_bitmap)
-        
-        # Inode Bitmap
-        f.seek(g.inode_bitmap_blk * BLOCK_SIZE)
-        f.write(g.inode_bitmap)
-        
-        # Inode Table (Initialize to 0)
-        # But we need to write Root Inode and Lost+Found
-        if g.id == root_group_idx:
-            # Root Inode (Inode 2)
-            # Offset in table = (2-1) * 128 = 128
-            inode_offset = (root_inode_index - 1) % INODES_PER_GROUP
-            
-            root_inode = bytearray(INODE_SIZE)
-            # Mode: Directory (0x4000) | 0755 (0x1ED) = 0x41ED
-            struct.pack_into("<H", root_inode, 0, 0x41ED)
-            struct.pack_into("<I", root_inode, 4, BLOCK_SIZE) # Size
-            struct.pack_into("<I", root_inode, 28, 2) # Sectors (1KB block = 2 sectors)
-            struct.pack_into("<H", root_inode, 26, 3) # Links (., .., lost+found)
-            
-            # Block 0
-            struct.pack_into("<I", root_inode, 40, root_data_block)
-            
-            f.seek(g.inode_table_blk * BLOCK_SIZE + inode_offset * INODE_SIZE)
-            f.write(root_inode)
-            
-        if g.id == lf_group_idx:
-             # Lost+Found Inode (Inode 11)
-            inode_offset = (lf_inode_index - 1) % INODES_PER_GROUP
-            
-            lf_inode = bytearray(INODE_SIZE)
-            struct.pack_into("<H", lf_inode, 0, 0x41ED)
-            struct.pack_into("<I", lf_inode, 4, BLOCK_SIZE)
-            struct.pack_into("<I", lf_inode, 28, 2)
-            struct.pack_into("<H", lf_inode, 26, 2) # Links (., ..)
-            struct.pack_into("<I", lf_inode, 40, lf_data_block)
-            
-            f.seek(g.inode_table_blk * BLOCK_SIZE + inode_offset * INODE_SIZE)
-            f.write(lf_inode)
-
-    # Write Directory Entries
-    
-    # Root Directory Entries
-    # 1. "." (Inode 2)
-    # 2. ".." (Inode 2)
-    # 3. "lost+found" (Inode 11)
-    
-    root_block = bytearray(BLOCK_SIZE)
-    offset = 0
-    
-    # Entry 1: "."
-    # inode=2, rec_len=12, name_len=1, type=2(DIR), name='.'
-    struct.pack_into("<IHBB1s", root_block, offset, 2, 12, 1, 2, b'.')
-    offset += 12
-    
-    # Entry 2: ".."
-    # inode=2, rec_len=12, name_len=2, type=2, name='..'
-    struct.pack_into("<IHBB2s", root_block, offset, 2, 12, 2, 2, b'..')
-    offset += 12
-    
-    # Entry 3: "lost+found"
-    # inode=11, rec_len=remaining, name_len=10, type=2, name='lost+found'
-    name_len = 10
-    rec_len = BLOCK_SIZE - offset
-    struct.pack_into("<IHBB10s", root_block, offset, 11, rec_len, name_len, 2, b'lost+found')
-    
-    f.seek(root_data_block * BLOCK_SIZE)
-    f.write(root_block)
-    
-    # Lost+Found Directory Entries
-    # 1. "." (Inode 11)
-    # 2. ".." (Inode 2)
-    
-    lf_block = bytearray(BLOCK_SIZE)
-    offset = 0
-    
-    struct.pack_into("<IHBB1s", lf_block, offset, 11, 12, 1, 2, b'.')
-    offset += 12
-    
-    rec_len = BLOCK_SIZE - offset
-    struct.pack_into("<IHBB2s", lf_block, offset, 2, rec_len, 2, 2, b'..')
-    
-    f.seek(lf_data_block * BLOCK_SIZE)
-    f.write(lf_block)
+    _GDT.pack_into(gdt, 0, *[field for d in descs for field in d.fields()])
+    put(2 * BLOCK_SIZE, gdt)
+
+    # Write Bitmaps (adjacent on disk, so write_image merges each pair)
+    for i, d in enumerate(descs):
+        put(d.block_bitmap * BLOCK_SIZE, block_bitmap(bitmaps, i))
+        put(d.inode_bitmap * BLOCK_SIZE, inode_bitmap(bitmaps, i))
+
+    # Inode Tables are already zero; only Root and Lost+Found need writing
+    # Root Inode (Inode 2)
+    # Offset in table = (2-1) * 128 = 128
+    root_inode = bytearray(INODE_SIZE)
+    # Mode: Directory (0x4000) | 0755 (0x1ED) = 0x41ED
+    _U16.pack_into(root_inode, 0, 0x41ED)
+    _U32.pack_into(root_inode, 4, BLOCK_SIZE) # Size
+    _U32.pack_into(root_inode, 28, 2) # Sectors (1KB block = 2 sectors)
+    _U16.pack_into(root_inode, 26, 3) # Links (., .., lost+found)
+    _U32.pack_into(root_inode, 40, root_data_block) # Block 0
+    table = descs[root_group_idx].inode_table * BLOCK_SIZE
+    put(table + root_inode_offset * INODE_SIZE, root_inode)
+
+    # Lost+Found Inode (Inode 11)
+    lf_inode = bytearray(INODE_SIZE)
+    _U16.pack_into(lf_inode, 0, 0x41ED)
+    _U32.pack_into(lf_inode, 4, BLOCK_SIZE)
+    _U32.pack_into(lf_inode, 28, 2)
+    _U16.pack_into(lf_inode, 26, 2) # Links (., ..)
+    _U32.pack_into(lf_inode, 40, lf_data_block)
+    table = descs[lf_group_idx].inode_table * BLOCK_SIZE
+    put(table + lf_inode_offset * INODE_SIZE, lf_inode)
+
+    # Write Directory Entries (templates with the inode numbers patched in)
+    root_block = bytearray(ROOT_DIR_TEMPLATE)
+    _U32.pack_into(root_block, 0, root_inode_index)   # "."
+    _U32.pack_into(root_block, 12, root_inode_index)  # ".."
+    _U32.pack_into(root_block, 24, lf_inode_index)    # "lost+found"
+    put(root_data_block * BLOCK_SIZE, root_block)
+
+    lf_block = bytearray(LF_DIR_TEMPLATE)
+    _U32.pack_into(lf_block, 0, lf_inode_index)       # "."
+    _U32.pack_into(lf_block, 12, root_inode_index)    # ".."
+    put(lf_data_block * BLOCK_SIZE, lf_block)
+
+    return extents
+
+def _pwrite(fd, data, off):
+    # Positional write; emulated with lseek where os.pwrite is missing (Windows)
+    if hasattr(os, "pwrite"):
+        return os.pwrite(fd, data, off)
+    os.lseek(fd, off, os.SEEK_SET)
+    return os.write(fd, data)
+
+def _coalesce(extents):
+    # Merge extents that abut on disk (SB, GDT and group 0's bitmaps are
+    # back to back) so each contiguous run goes out in a single pwrite
+    runs = []
+    for off, data in sorted(extents, key=lambda e: e[0]):
+        if runs:
+            run_off, run_data = runs[-1]
+            if run_off + len(run_data) == off:
+                run_data += data
+                continue
+        runs.append((off, bytearray(data)))
+    return runs
+
+def write_image(path, extents, sparse=False):
+    # Write a DISK_SIZE image to path with positional writes (no seek or
+    # file-position tracking). Only the given extents are written. By default
+    # the whole file is first preallocated with posix_fallocate so the host FS
+    # can hand out large contiguous extents and later sequential reads stream
+    # quickly. With sparse=True the rest is left as ftruncate holes instead:
+    # 64 MiB apparent size but only a few KiB allocated (`cp --sparse=never`
+    # makes it dense).
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    fd = os.open(path, flags, 0o644)
+    try:
+        if sparse:
+            os.ftruncate(fd, DISK_SIZE)
+        else:
+            try:
+                os.posix_fallocate(fd, 0, DISK_SIZE)
+            except (AttributeError, OSError):
+                # Missing on Windows and macOS, and rejected by some target
+                # filesystems (e.g. EOPNOTSUPP on FUSE/9p shares, EINVAL on ZFS)
+                os.ftruncate(fd, DISK_SIZE)
+        for off, data in _coalesce(extents):
+            data = memoryview(data)
+            while data:
+                n = _pwrite(fd, data, off)
+                data = data[n:]
+                off += n
+    finally:
+        os.close(fd)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Format disk.img with Ext2")
+    parser.add_argument("--sparse", action="store_true",
+        help="leave unused regions as holes instead of preallocating the image")
+    args = parser.parse_args()
+
+    extents = build_image()
+    write_image("disk.img", extents, sparse=args.sparse)
 
-print("Formatted disk.img with Ext2")
+    print("Formatted disk.img with Ext2")